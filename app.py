@@ -1,154 +1,50 @@
 import streamlit as st
 import pandas as pd
-from fpdf import FPDF
 import zipfile
 import io
-import re
+import os
+import tempfile
 import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 
-# ============ 🧹 Utility Functions ============
-
-def clean_text(text):
-    """Remove unsupported Unicode characters."""
-    return re.sub(r'[^\x00-\x7F]+', '', str(text))
-
-def sanitize_filename(text):
-    """Remove special characters and limit filename length."""
-    sanitized = re.sub(r'[\\/*?:"<>|]', "", str(text))
-    return sanitized[:20]  # Limit filename length
-
-def extract_crew_names(crew_string):
-    """Extract only crew names without extra text like 'Excl Happy Sweep HC3'."""
-    names = re.sub(r'Excl Happy Sweep HC\d*', '', crew_string)
-    names = ', '.join([name.strip() for name in names.split(',') if name.strip()])
-    return names
-
-# ============ 🧾 PDF Invoice Generator ============
-
-def generate_invoice(row, logo_bytes):
-    pdf = FPDF()
-    pdf.add_page()
-
-    # Colors
-    navy_color = (54, 79, 107)
-    light_gray = (240, 240, 240)
-    dark_gray = (90, 90, 90)
-    accent_color = (93, 173, 226)  # Soft blue for highlights
-
-    # Fonts
-    pdf.set_font("Helvetica", '', 12)
-
-    # Save logo temporarily
-    logo_path = "temp_logo.png"
-    with open(logo_path, "wb") as logo_file:
-        logo_file.write(logo_bytes)
-
-    # ✅ Add logo
-    pdf.image(logo_path, x=10, y=5, w=70)
-
-    # Invoice Title
-    pdf.set_font("Helvetica", 'B', 24)
-    pdf.set_text_color(*navy_color)
-    pdf.set_xy(140, 12)
-    pdf.cell(50, 10, 'INVOICE', ln=True, align='R')
-
-    # Company Info
-    pdf.set_font("Helvetica", '', 10)
-    pdf.set_text_color(*dark_gray)
-    pdf.set_xy(140, 25)
-    pdf.multi_cell(60, 5, "Happy Sweep Cleaning Company\nPhone: +971 568780406\nEmail: happysweep.cleaning@gmail.com\nDubai - United Arab Emirates", align='R')
-    pdf.ln(3)
-
-    # Divider Line
-    pdf.set_draw_color(220, 220, 220)
-    pdf.set_line_width(0.5)
-    pdf.line(10, 52, 200, 52)
-    pdf.ln(5)
-
-    # Invoice Number & Date
-    pdf.set_font("Helvetica", '', 12)
-    reference_no = sanitize_filename(row['Reference No'])
-    pdf.cell(0, 8, f"Invoice Number: {clean_text(reference_no)}", ln=True)
-    pdf.cell(0, 8, f"Date: {clean_text(row.get('Starting At', 'N/A'))}", ln=True)
-    pdf.ln(5)
-
-    # Client Information
-    pdf.set_fill_color(*light_gray)
-    pdf.set_font("Helvetica", 'B', 14)
-    pdf.cell(0, 10, 'Client Information', ln=True, fill=True)
-
-    pdf.set_font("Helvetica", '', 12)
-    pdf.cell(0, 8, f"Client Name: {clean_text(row['Client Name'])}", ln=True)
-    pdf.cell(0, 8, f"Client ID: {clean_text(row['Client ID'])}", ln=True)
-    pdf.cell(0, 8, f"Address: {clean_text(row['Client Address'])}", ln=True)
-    pdf.cell(0, 8, f"Region: {clean_text(row['Client Region'])}", ln=True)
-    pdf.ln(5)
-
-    # Service Details
-    pdf.set_fill_color(*light_gray)
-    pdf.set_font("Helvetica", 'B', 14)
-    pdf.cell(0, 10, 'Service Details', ln=True, fill=True)
-
-    pdf.set_font("Helvetica", '', 12)
-    pdf.cell(0, 8, f"Service Start: {clean_text(row['Starting At'])}", ln=True)
-    pdf.cell(0, 8, f"Service End: {clean_text(row['Ending At'])}", ln=True)
-
-    # Extract clean crew names
-    appointment_attributes = clean_text(row.get('Appointment Attributes', 'N/A'))
-    assigned_crew_raw = clean_text(row.get('Assigned Crew Member', 'N/A'))
-    assigned_crew = extract_crew_names(assigned_crew_raw)
-
-    pdf.multi_cell(0, 8, f"Appointment Attributes:\n{appointment_attributes}")
-    pdf.set_font("Helvetica", 'B', 12)
-    pdf.cell(0, 8, f"Assigned Crew: {assigned_crew}", ln=True)
-    pdf.ln(5)
-
-    # Payment Information with VAT
-    pdf.set_fill_color(*light_gray)
-    pdf.set_font("Helvetica", 'B', 14)
-    pdf.cell(0, 10, 'Payment Information', ln=True, fill=True)
-
-    pdf.set_text_color(0, 0, 0)
-    pdf.set_font("Helvetica", '', 12)
-
-    try:
-        booking_amount = float(row['Booking Amount'])
-    except ValueError:
-        booking_amount = 0.0
-
-    vat = booking_amount * 0.05
-    total = booking_amount + vat
-
-    pdf.cell(0, 8, f"Booking Amount: AED {booking_amount:.2f}", ln=True)
-    pdf.cell(0, 8, f"VAT (5%): AED {vat:.2f}", ln=True)
-    pdf.set_font("Helvetica", 'B', 14)
-    pdf.cell(0, 10, f"Total Amount: AED {total:.2f}", ln=True)
-    pdf.set_font("Helvetica", '', 12)
-    pdf.cell(0, 8, f"Payment Method: {clean_text(row['Payment Method'])}", ln=True)
-
-    # ✅ Divider after Payment Method
-    pdf.set_draw_color(220, 220, 220)
-    pdf.set_line_width(0.5)
-    pdf.line(10, pdf.get_y() + 3, 200, pdf.get_y() + 3)
-    pdf.ln(8)
-
-    # ✅ Final Footer Line (Smaller, Italic, Black for Thank You)
-    pdf.set_text_color(0, 0, 0)  # Black color
-    pdf.set_font("Helvetica", 'I', 10)  # Italic and smaller
-    pdf.cell(0, 10, "Thank you for choosing Happy Sweep Cleaning Company!", ln=True, align='C')
-
-    pdf_output = pdf.output(dest='S').encode('latin1')
-    filename = f"Invoice_{reference_no}.pdf"
-    return filename, pdf_output
+from invoice import TEXT_COLS, add_amount_columns, clean_text_columns, generate_invoice_worker, init_worker
 
 # ============ 🚀 Streamlit App ============
 
+ARCHIVE_MAX_AGE = 24 * 60 * 60  # seconds
+
+@st.cache_resource
+def archive_dir():
+    """Private (0700, unpredictable name) directory for invoice archives, one per server process."""
+    return tempfile.mkdtemp(prefix="happy_sweep_invoices_")
+
+def remove_stale_archives(directory):
+    """Delete archives not rewritten for ARCHIVE_MAX_AGE, i.e. left behind by ended sessions."""
+    cutoff = time.time() - ARCHIVE_MAX_AGE
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass  # Removed concurrently by another session
+
+@st.cache_data(show_spinner=False, max_entries=4, ttl=60 * 60)
+def load_df(file_bytes):
+    """Parse and prepare the uploaded sheet; cached on the file contents so reruns skip the parse."""
+    df = pd.read_excel(io.BytesIO(file_bytes), engine='calamine', dtype={col: str for col in TEXT_COLS})
+    df = clean_text_columns(df)
+    return add_amount_columns(df)
+
 st.title("📋 Invoice Generator - Happy Sweep (Final Version)")
 st.write("Upload your Excel file and generate invoices. Invoices will be downloaded directly through the browser.")
 
 # Initialize session state
-if 'invoices' not in st.session_state:
-    st.session_state.invoices = []
+if 'invoices_zip_path' not in st.session_state:
+    st.session_state.invoices_zip_path = None
+if 'session_key' not in st.session_state:
+    st.session_state.session_key = uuid.uuid4().hex
 if 'uploaded_file' not in st.session_state:
     st.session_state.uploaded_file = None
 if 'logo' not in st.session_state:
@@ -166,54 +62,92 @@ if uploaded_file:
 
 # Check if both files are uploaded
 if st.session_state.uploaded_file and st.session_state.logo:
-    df = pd.read_excel(st.session_state.uploaded_file)
+    df = load_df(st.session_state.uploaded_file.getvalue())
 
     if st.button("Generate Invoices"):
         progress_bar = st.progress(0)
         status_text = st.empty()
         total_rows = len(df)
-
-        invoices = []
-
-        for idx, (_, row) in enumerate(df.iterrows()):
-            filename, pdf_bytes = generate_invoice(row, st.session_state.logo)
-            invoices.append((filename, pdf_bytes))
-
-            progress = (idx + 1) / total_rows
-            progress_bar.progress(progress)
-            status_text.text(f"Processing Invoice {idx + 1} of {total_rows}")
-
-            time.sleep(0.01)
-
-        st.session_state.invoices = invoices
+        progress_step = max(1, total_rows // 100)
+
+        records = df.to_dict('records')
+
+        # Spool the archive to disk instead of accumulating the PDFs in memory.
+        # One file per session, overwritten on each run; abandoned ones are swept.
+        # Archives hold customer details, so keep them readable by this process only
+        directory = archive_dir()
+        remove_stale_archives(directory)
+        zip_path = os.path.join(directory, f"invoices_{st.session_state.session_key}.zip")
+        st.session_state.invoices_zip_path = None
+
+        # Managed explicitly rather than with `with`: its __exit__ waits for every queued
+        # invoice, which would block a Streamlit stop/rerun until the whole run finished
+        executor = ProcessPoolExecutor(
+            max_workers=min(os.cpu_count() or 1, 8),
+            initializer=init_worker,
+            initargs=(st.session_state.logo,),
+        )
+        results = None
+
+        try:
+            # PDFs are already compressed internally, so store them without deflate
+            zip_fd = os.open(zip_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(zip_fd, 'wb') as zip_file, \
+                    zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
+                # map yields results in row order and releases each one once consumed
+                results = executor.map(generate_invoice_worker, records, chunksize=8)
+                written = set()
+                for idx, (filename, pdf_bytes) in enumerate(results):
+                    # Empty or truncated references can collide; suffix the row number so
+                    # every invoice stays reachable on its own
+                    if filename in written:
+                        stem, ext = os.path.splitext(filename)
+                        filename = f"{stem}_row{idx + 1}{ext}"
+                    written.add(filename)
+                    zipf.writestr(filename, pdf_bytes)
+
+                    # Throttle UI updates to at most ~100 per run
+                    if idx % progress_step == 0:
+                        progress = (idx + 1) / total_rows
+                        progress_bar.progress(progress)
+                        status_text.text(f"Processing Invoice {idx + 1} of {total_rows}")
+        except BaseException:  # Also covers Streamlit stopping/rerunning the script mid-run
+            if results is not None:
+                results.close()  # Cancels the chunks still pending
+            executor.shutdown(wait=False, cancel_futures=True)
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
+            raise
+        executor.shutdown()
+
+        st.session_state.invoices_zip_path = zip_path
 
         progress_bar.progress(1.0)
         status_text.text("✅ Invoices Generated Successfully!")
 
 # If invoices exist, allow download
-if st.session_state.invoices:
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zipf:
-        for filename, pdf_bytes in st.session_state.invoices:
-            zipf.writestr(filename, pdf_bytes)
-
-    zip_buffer.seek(0)
-
+if st.session_state.invoices_zip_path and os.path.exists(st.session_state.invoices_zip_path):
     st.subheader("📁 Download All Invoices")
-    st.download_button(
-        label="📥 Download All Invoices (ZIP)",
-        data=zip_buffer,
-        file_name="Invoices.zip",
-        mime="application/zip"
-    )
-
-    st.subheader("📄 Download Individual Invoices")
-    for filename, pdf_bytes in st.session_state.invoices:
+    # Note: download_button reads the whole archive into memory on every rerun
+    with open(st.session_state.invoices_zip_path, 'rb') as zip_file:
         st.download_button(
-            label=f"📄 Download {filename}",
-            data=pdf_bytes,
-            file_name=filename,
-            mime='application/pdf'
+            label="📥 Download All Invoices (ZIP)",
+            data=zip_file,
+            file_name="Invoices.zip",
+            mime="application/zip"
         )
 
+    # One picker + one button instead of a download button per invoice;
+    # only the chosen PDF is read back out of the ZIP
+    st.subheader("📄 Download Individual Invoices")
+    with zipfile.ZipFile(st.session_state.invoices_zip_path) as zipf:
+        chosen = st.selectbox("Pick invoice", zipf.namelist())
+        if chosen:
+            st.download_button(
+                label=f"📄 Download {chosen}",
+                data=zipf.read(chosen),
+                file_name=chosen,
+                mime='application/pdf'
+            )
+
     st.success("📁 Invoices are ready for download. Check your Downloads folder.")
@@ -0,0 +1,212 @@
+import pandas as pd
+from fpdf import FPDF, XPos, YPos
+from fpdf.fonts import CoreFont
+import io
+import copy
+import re
+from functools import lru_cache
+
+_NON_ASCII = re.compile(r'[^\x00-\x7F]+')
+_FN_BAD = re.compile(r'[\\/*?:"<>|]')
+_CREW = re.compile(r'Excl Happy Sweep HC\d*')
+
+TEXT_COLS = ['Client Name', 'Client ID', 'Client Address', 'Client Region', 'Starting At', 'Ending At',
+             'Appointment Attributes', 'Assigned Crew Member', 'Payment Method', 'Reference No']
+
+# ============ 🧹 Utility Functions ============
+
+def clean_text_columns(df):
+    """Strip unsupported Unicode from every text column in one vectorized pass.
+
+    Expects TEXT_COLS to have been read as str (see the dtype passed to pd.read_excel).
+    Empty cells become 'N/A', matching the fallback for missing columns, so every
+    value reaching the renderer is a str.
+    """
+    for col in TEXT_COLS:
+        if col in df:
+            df[col] = df[col].str.replace(_NON_ASCII, '', regex=True).fillna('N/A')
+    return df
+
+def add_amount_columns(df):
+    """Precompute Booking Amount, VAT (5%) and Total as float columns."""
+    df['Booking Amount'] = pd.to_numeric(df['Booking Amount'], errors='coerce').fillna(0.0)
+    # Round Total exactly like the original f"{booking_amount + vat:.2f}" (Python's round() is
+    # correctly rounded; Series.round is not), then derive VAT from it so the printed
+    # Amount + VAT always equals the printed Total
+    amount = df['Booking Amount']
+    df['Total'] = (amount + amount * 0.05).map(lambda total: round(total, 2))
+    df['VAT'] = (df['Total'] - amount.map(lambda value: round(value, 2))).round(2)
+    return df
+
+def sanitize_filename(text):
+    """Remove special characters and limit filename length."""
+    return _sanitize_filename(str(text))
+
+@lru_cache(maxsize=4096)
+def _sanitize_filename(text):
+    sanitized = _FN_BAD.sub("", text)
+    return sanitized[:20]  # Limit filename length
+
+def extract_crew_names(crew_string):
+    """Extract only crew names without extra text like 'Excl Happy Sweep HC3'."""
+    return _extract_crew_names(str(crew_string))
+
+@lru_cache(maxsize=4096)
+def _extract_crew_names(crew_string):
+    names = _CREW.sub('', crew_string)
+    names = ', '.join([name.strip() for name in names.split(',') if name.strip()])
+    return names
+
+# ============ 🧾 PDF Invoice Generator ============
+
+# Colors
+NAVY_COLOR = (54, 79, 107)
+LIGHT_GRAY = (240, 240, 240)
+DARK_GRAY = (90, 90, 90)
+BLACK = (0, 0, 0)
+ACCENT_COLOR = (93, 173, 226)  # Soft blue for highlights
+
+def _build_template(logo_bytes):
+    """Build the fixed page header (logo, title, company info) shared by every invoice."""
+    pdf = FPDF()
+    pdf.add_page()
+
+    # Fonts
+    pdf.set_font("Helvetica", '', 12)
+
+    # ✅ Add logo (straight from memory, no temp file)
+    pdf.image(io.BytesIO(logo_bytes), x=10, y=5, w=70)
+
+    # Invoice Title
+    pdf.set_font("Helvetica", 'B', 24)
+    pdf.set_text_color(*NAVY_COLOR)
+    pdf.set_xy(140, 12)
+    pdf.cell(50, 10, 'INVOICE', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='R')
+
+    # Company Info
+    pdf.set_font("Helvetica", '', 10)
+    pdf.set_text_color(*DARK_GRAY)
+    pdf.set_xy(140, 25)
+    pdf.multi_cell(60, 5, "Happy Sweep Cleaning Company\nPhone: +971 568780406\nEmail: happysweep.cleaning@gmail.com\nDubai - United Arab Emirates", align='R')
+    pdf.ln(3)
+
+    # Divider Line
+    pdf.set_draw_color(220, 220, 220)
+    pdf.set_line_width(0.5)
+    pdf.line(10, 52, 200, 52)
+    pdf.ln(5)
+
+    return pdf
+
+def _render_row(pdf, row):
+    """Render the per-row sections onto a copy of the template. Returns the reference number."""
+    last_state = {}
+
+    def set_style(style, size, tc, fill=None):
+        """Apply font, text and fill color, skipping any that are already in effect."""
+        if last_state.get('font') != (style, size):
+            pdf.set_font("Helvetica", style, size)
+            last_state['font'] = (style, size)
+        if last_state.get('tc') != tc:
+            pdf.set_text_color(*tc)
+            last_state['tc'] = tc
+        if fill is not None and last_state.get('fill') != fill:
+            pdf.set_fill_color(*fill)
+            last_state['fill'] = fill
+
+    # Invoice Number & Date
+    set_style('', 12, DARK_GRAY)
+    reference_no = sanitize_filename(row['Reference No'])
+    pdf.cell(0, 8, f"Invoice Number: {reference_no}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 8, f"Date: {row.get('Starting At', 'N/A')}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(5)
+
+    # Client Information
+    set_style('B', 14, DARK_GRAY, fill=LIGHT_GRAY)
+    pdf.cell(0, 10, 'Client Information', new_x=XPos.LMARGIN, new_y=YPos.NEXT, fill=True)
+
+    set_style('', 12, DARK_GRAY)
+    pdf.cell(0, 8, f"Client Name: {row['Client Name']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 8, f"Client ID: {row['Client ID']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 8, f"Address: {row['Client Address']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 8, f"Region: {row['Client Region']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(5)
+
+    # Service Details
+    set_style('B', 14, DARK_GRAY, fill=LIGHT_GRAY)
+    pdf.cell(0, 10, 'Service Details', new_x=XPos.LMARGIN, new_y=YPos.NEXT, fill=True)
+
+    set_style('', 12, DARK_GRAY)
+    pdf.cell(0, 8, f"Service Start: {row['Starting At']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 8, f"Service End: {row['Ending At']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    # Extract clean crew names
+    appointment_attributes = str(row.get('Appointment Attributes', 'N/A'))
+    assigned_crew_raw = row.get('Assigned Crew Member', 'N/A')
+    assigned_crew = extract_crew_names(assigned_crew_raw)
+
+    # multi_cell runs fpdf2's full line-breaking pass, so only use it when the text needs
+    # wrapping or has explicit line breaks (Alt+Enter in Excel), which cell() can't render
+    pdf.cell(0, 8, "Appointment Attributes:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    if '\n' not in appointment_attributes and \
+            pdf.get_string_width(appointment_attributes) <= pdf.epw - 2 * pdf.c_margin:
+        pdf.cell(0, 8, appointment_attributes, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    else:
+        pdf.multi_cell(0, 8, appointment_attributes, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    set_style('B', 12, DARK_GRAY)
+    pdf.cell(0, 8, f"Assigned Crew: {assigned_crew}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(5)
+
+    # Payment Information with VAT
+    set_style('B', 14, DARK_GRAY, fill=LIGHT_GRAY)
+    pdf.cell(0, 10, 'Payment Information', new_x=XPos.LMARGIN, new_y=YPos.NEXT, fill=True)
+
+    set_style('', 12, BLACK)
+
+    booking_amount = row['Booking Amount']
+    vat = row['VAT']
+    total = row['Total']
+
+    pdf.cell(0, 8, f"Booking Amount: AED {booking_amount:.2f}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 8, f"VAT (5%): AED {vat:.2f}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    set_style('B', 14, BLACK)
+    pdf.cell(0, 10, f"Total Amount: AED {total:.2f}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    set_style('', 12, BLACK)
+    pdf.cell(0, 8, f"Payment Method: {row['Payment Method']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    # ✅ Divider after Payment Method
+    pdf.set_draw_color(220, 220, 220)
+    pdf.set_line_width(0.5)
+    pdf.line(10, pdf.get_y() + 3, 200, pdf.get_y() + 3)
+    pdf.ln(8)
+
+    # ✅ Final Footer Line (Smaller, Italic, Black for Thank You)
+    set_style('I', 10, BLACK)  # Italic and smaller
+    pdf.cell(0, 10, "Thank you for choosing Happy Sweep Cleaning Company!", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
+
+    return reference_no
+
+def _copy_template(template):
+    """Deep-copy the template, sharing its read-only core font metrics instead of copying them."""
+    memo = {id(font): font for font in template.fonts.values() if isinstance(font, CoreFont)}
+    return copy.deepcopy(template, memo)
+
+def generate_invoice(row, template):
+    pdf = _copy_template(template)
+    reference_no = _render_row(pdf, row)
+
+    pdf_output = bytes(pdf.output())
+    filename = f"Invoice_{reference_no}.pdf"
+    return filename, pdf_output
+
+# ============ ⚙️ Worker Pool ============
+
+_worker_template = None
+
+def init_worker(logo_bytes):
+    """Build the invoice template once per worker process; each row deep-copies it."""
+    global _worker_template
+    _worker_template = _build_template(logo_bytes)
+
+def generate_invoice_worker(row):
+    return generate_invoice(row, _worker_template)